@@ -3,14 +3,19 @@
 # Pi Wedge breakout board and a SparkFun Serial 7 Segment display:
 # https://www.sparkfun.com/products/11629
 
+import os
 import time
 import spidev
 import math
 import random
 import datetime
+import logging
 from colorutils import Color, ArithmeticModel
 
 
+# Progress of the animations, only formatted when debug logging is on
+log = logging.getLogger(__name__)
+
 # We only have SPI bus 0 available to us on the Pi
 bus = 0
 
@@ -27,14 +32,53 @@ spi.open(bus, device)
 spi.max_speed_hz = 500000
 spi.mode = 0
 
+# The leds never answer, so frames are sent with writebytes2 (spidev >= 3.4).
+# Unlike xfer2 it takes bytes/bytearray/memoryview as a buffer without
+# converting them to a list, and doesn't build a list of the bytes read back.
+# Animations that slide a window over a fixed pattern slice a memoryview
+# of it, so a frame is never copied before it is sent.
+
+# Last frame sent to the leds. They keep showing it until the next one,
+# so sending the same frame again is wasted SPI time.
+last_frame = bytearray()
+
+def show(buf):
+    if buf == last_frame:
+        return
+    spi.writebytes2(buf)
+    last_frame[:] = buf
+
+# When the next frame is due. Sleeping until then, instead of a fixed
+# time after each frame, keeps the frame rate independent of how long
+# building and sending the frame took.
+next_frame = time.monotonic()
+
+def wait(delay):
+    global next_frame
+    next_frame += delay
+    now = time.monotonic()
+    if next_frame > now:
+        time.sleep(next_frame - now)
+    else:
+        # Running late (or a new animation), start over from now
+        # instead of rushing frames out to catch up
+        next_frame = now
+
 # Clear display
-msg = [0] * 300
-spi.xfer2(msg)
+msg = bytes(300)
+show(msg)
 
 
 
 kickis_fav = [255,25,2]
 
+# Preallocated frame, 100 leds * rgb. Animations write into this
+# instead of building a new list every frame.
+frame = bytearray(300)
+
+# All leds in kickis_fav, used as background by the blinka animations
+kickis_fav_frame = bytes(kickis_fav * 100)
+
 def a(n):
     a = [
        [ 255, 0, 0 ],
@@ -42,14 +86,17 @@ def a(n):
        [ 0, 0, 255 ],
        [ 255, 0, 255 ]
     ]
+    # Only four different 3-led pieces, build them once
+    a = [bytes(c * 3) for c in a]
 
+    # Sent in small pieces below, so the last full frame is not known
+    last_frame.clear()
     for j in range(n):
-        print('a', j, n)
+        log.debug('a %d %d', j, n)
         for i in range(40):
             N = ((j + i) % len(a))
-            c = a[N]
-            spi.xfer2(c * 3)
-        time.sleep(0.1)
+            spi.writebytes2(a[N])
+        wait(0.1)
         j += 1
 
 def b(n):
@@ -58,38 +105,50 @@ def b(n):
         [ 0, 255, 0 ],
         [ 0, 0, 255 ]
     ]
+    # Build each solid color frame once instead of every iteration
+    b = [bytes(c * 40 * 3) for c in b]
     for j in range(n):
-        print('b', j, n)
-        spi.xfer2(b[j % len(b)] * 40 * 3)
-        time.sleep(0.1)
+        log.debug('b %d %d', j, n)
+        show(b[j % len(b)])
+        wait(0.1)
 
 # mask
+def fade_tail():
+    # The fading tail is the same in every frame, only its position moves
+    tail = []
+    for z in range(10):
+        P = math.floor(255/(((10-z)*2)+1))
+        tail += [P,P,P]
+    return bytes(tail)
+
+# Each masken frame is the tail with i dark leds before it and the rest of
+# the strip dark after it. Lay that out once at startup with room on both
+# sides, so every frame is just a slice of it.
+masken_strip = memoryview(bytes(99*3) + fade_tail() + bytes(90*3))
+
+# Same sliding window for masken2, around the wave with the leds before and
+# after it cut from the cached kickis_fav frame
+masken2_strip = memoryview(kickis_fav_frame[:99*3] + bytes([255,50,3] * 15) + kickis_fav_frame[:90*3])
+
 def masken(n):
     b = [255, 255, 255]
     for j in range(n):
-        print('c', j, n)
+        log.debug('c %d %d', j, n)
         for i in range(100):
-            w = [0,0,0]*i
-            for z in range(10):
-                P = math.floor(255/(((10-z)*2)+1))
-                w += [P,P,P]
-            w += [0,0,0] * (100-i-10)
-            spi.xfer2(w)
-            time.sleep(0.01)
+            start = (99-i)*3
+            w = masken_strip[start:start + max(100, i+10)*3]
+            show(w)
+            wait(0.01)
 
 def masken2(n):
     b = kickis_fav
     for j in range(n):
-        print('c', j, n)
+        log.debug('c %d %d', j, n)
         for i in range(100):
-            w = kickis_fav*i
-            for z in range(15):
-                #P = math.floor(255/(((10-z)*2)+1))
-                #w += [P,P,P]
-                w += [255,50,3]
-            w += kickis_fav * (100-i-10)
-            spi.xfer2(w)
-            time.sleep(0.05)
+            start = (99-i)*3
+            w = masken2_strip[start:start + max(105, i+15)*3]
+            show(w)
+            wait(0.05)
 
 def gradient(f1, f2, f3, ph1, ph2, ph3, i, c=128, w=127, l=100):
     r = (math.sin(f1 * i + ph1) * 0.5 + 0.5) * 255
@@ -97,62 +156,62 @@ def gradient(f1, f2, f3, ph1, ph2, ph3, i, c=128, w=127, l=100):
     b = (math.sin(f3 * i + ph3) * 0.5 + 0.5) * 255
     return [math.floor(r), math.floor(g), math.floor(b)]
 
+# The kickis gradient only depends on the step, so compute all 418 colors
+# once, and the full frames for them (~125kB per table)
+kickis_colors = [bytes(gradient(0.3, 0.3, 0.3, 0, 2, 3, j * 0.1)) for j in range(418)]
+kickis_colors_utan_bla = [bytes([r, g, 0]) for r, g, b in kickis_colors]
+kickis_frames = [z * 100 for z in kickis_colors]
+kickis_frames_utan_bla = [z * 100 for z in kickis_colors_utan_bla]
+
 def kickis(n):
     # kickis j: 63 [248, 40, 2]
     for Q in range(n):
-        for j in range(418):
-            z = gradient(0.3, 0.3, 0.3, 0, 2, 3, j * 0.1)
-            spi.xfer2(z * 100)
-            time.sleep(0.1)
+        for z in kickis_frames:
+            show(z)
+            wait(0.1)
 
 def kickis_utan_bla(n):
     # kickis j: 63 [248, 40, 2]
     for Q in range(n):
-        for j in range(418):
-            z = gradient(0.3, 0.3, 0.3, 0, 2, 3, j * 0.1)
-            z[2] = 0
-            spi.xfer2(z * 100)
-            time.sleep(0.1)
+        for z in kickis_frames_utan_bla:
+            show(z)
+            wait(0.1)
 
 def blinka(n):
+    sparkle = bytes([200,200,80])
+    # Pick the positions for all frames at once, two sparkles per frame
+    spots = random.choices(range(0, 98*3, 3), k=n*2)
     for i in range(n):
-        a = kickis_fav*100
-        z = (random.randint(0,97) * 3)
-        a[z] = 200
-        a[z+1] = 200
-        a[z+2]=80
-        z = (random.randint(0,97) * 3)
-        a[z] = 200
-        a[z+1] = 200
-        a[z+2]=80
-        spi.xfer2(a)
-        time.sleep(0.04)
+        frame[:] = kickis_fav_frame
+        z = spots[i*2]
+        frame[z:z+3] = sparkle
+        z = spots[i*2+1]
+        frame[z:z+3] = sparkle
+        show(frame)
+        wait(0.04)
 #        a = [248,40,2]*100
 #        spi.xfer2(a)
 #        time.sleep(0.02)
 
 def blinka_slow(n):
+    sparkle = bytes([180,180,180]) #[200,200,40]
     for i in range(n):
-        a = kickis_fav*100
+        frame[:] = kickis_fav_frame
         if n % 100 == 0:
           z = (random.randint(0,97) * 3)
-          a[z] = 180 #200
-          a[z+1] = 180 #200
-          a[z+2]= 180 #40
-        spi.xfer2(a)
-        time.sleep(0.05)
-        a = kickis_fav*100
-        spi.xfer2(a)
-        time.sleep(2)
+          frame[z:z+3] = sparkle
+        show(frame)
+        wait(0.05)
+        show(kickis_fav_frame)
+        wait(2)
 
 def kicki2(n):
     for i in range(n):
         #a = [random.randint(0, 255)]*255
-        a = []
-        for j in range(300):
-            a.append(random.randint(0,255))
-        spi.xfer2(a)
-        time.sleep(0.5)
+        # Random noise, 300 bytes in one call instead of 300 randint() calls
+        a = os.urandom(300)
+        show(a)
+        wait(0.5)
 
 def f(n):
     c = [
@@ -166,27 +225,30 @@ def f(n):
         0,0,0,
         0,0,0
     ]
+    # Repeat the pattern past the end of the strip so every frame is
+    # just a slice of it, starting one led further in each step
+    tiled = memoryview(bytes(c * ((100*3) // len(c) + 2)))
     for j in range(n):
-        print('f', j, n)
-        P=[]
-        for i in range(100*3):
-            P.append(c[(i+(j*3)) % len(c)])
+        log.debug('f %d %d', j, n)
+        o = (j*3) % len(c)
+        P = tiled[o:o + 100*3]
 
-        spi.xfer2(P)
-        time.sleep(0.5)
+        show(P)
+        wait(0.5)
 
 def kicki_test():
     first = [255,25,2]
     second =[255,30,2]
+    # Both frames stay the same, build them once
+    first_frame = bytes(first*100)
+    second_frame = bytes(second*100)
     while True:
-        a = first*100
         print(first)
-        spi.xfer2(a)
-        time.sleep(1)
-        a = second*100
+        show(first_frame)
+        wait(1)
         print(second)
-        spi.xfer2(a)
-        time.sleep(1)
+        show(second_frame)
+        wait(1)
 
 
 